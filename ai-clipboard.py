@@ -13,12 +13,13 @@ Version: 1.2.0
 import sys
 import locale
 import pywinstyles
-import json, os, re, time, threading, tkinter as tk
+import json, os, re, io, time, base64, ctypes, textwrap, threading, tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox, PhotoImage
 import pyperclip, requests, logging
 import pystray
 from pystray import MenuItem as item, Menu
-from PIL import Image
+from PIL import Image, ImageGrab, features
 import winsound
 import sv_ttk
 import darkdetect
@@ -28,6 +29,11 @@ FONT_FAMILY = 'Segoe UI Emoji'
 FONT_SIZE = 10
 CONFIG_PATH = 'config.json'
 CACHE_PATH = 'models_cache.json'
+SPOOL_PATH = 'spool.json'
+RESPONSES_PATH = 'queued_responses.md'
+CONFIG_LOCK = threading.Lock()
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+WEBP_SUPPORTED = features.check('webp')
 
 def ensure_folders_exist():
 	os.makedirs("config", exist_ok=True)
@@ -59,6 +65,16 @@ def load_config():
 		"use_custom_prompt": False,
 		"default_model": "openai/gpt-4o-mini",
 		"model_shortcuts": {},
+		"image_max_side": 1568,
+		"image_max_kb": 1024,
+		"image_prompt_timeout": 60,
+		"spool_max_items": 20,
+		"spool_max_age_hours": 24,
+		"spool_replay_concurrency": 2,
+		"spool_probe_interval": 15,
+		"spool_max_attempts": 5,
+		"session_token_budget": 4000,
+		"session_idle_minutes": 30,
 		"balance_usd": 0.0
 	}
 	if os.path.exists(os.path.join("config", CONFIG_PATH)):
@@ -67,8 +83,100 @@ def load_config():
 	return default
 
 def save_config(cfg):
-	with open(os.path.join("config", CONFIG_PATH), 'w', encoding='utf-8') as f:
-		json.dump(cfg, f, indent=2)
+	# Balance updates from replay threads can save while the UI saves
+	with CONFIG_LOCK:
+		with open(os.path.join("config", CONFIG_PATH), 'w', encoding='utf-8') as f:
+			json.dump(cfg, f, indent=2)
+
+def load_spool():
+	if os.path.exists(os.path.join("cache", SPOOL_PATH)):
+		try:
+			with open(os.path.join("cache", SPOOL_PATH), 'r', encoding='utf-8') as f:
+				entries = json.load(f)
+			if isinstance(entries, list):
+				return [entry for entry in entries if isinstance(entry, dict)]
+			logging.error("Spool file is not a list, starting with an empty spool")
+		except (json.JSONDecodeError, OSError) as e:
+			logging.error(f"Spool file unreadable, starting with an empty spool: {e}")
+	return []
+
+def save_spool(entries):
+	# Write to a temporary file first so a crash mid-write doesn't lose queued prompts
+	path = os.path.join("cache", SPOOL_PATH)
+	with open(path + ".tmp", 'w', encoding='utf-8') as f:
+		json.dump(entries, f, indent=2)
+	os.replace(path + ".tmp", path)
+
+def load_knowledge(context_key):
+	with open(os.path.join("knowledge", f"{context_key}.md"), "r", encoding="utf-8") as f:
+		return "\n\n" + f.read().strip()
+
+def clipboard_sequence_number():
+	# Changes on every clipboard update, so the image is only grabbed when something new was copied
+	return ctypes.windll.user32.GetClipboardSequenceNumber()
+
+def grab_clipboard_image():
+	"""Returns the clipboard image, or the path of a copied image file (decoded later, off the Tk thread)."""
+	grabbed = ImageGrab.grabclipboard()
+	if isinstance(grabbed, Image.Image):
+		return grabbed
+	# Files copied in Explorer come back as a list of paths
+	if isinstance(grabbed, list):
+		for path in grabbed:
+			if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+				return path
+	return None
+
+def open_image(image):
+	if isinstance(image, Image.Image):
+		return image
+	opened = Image.open(image)
+	opened.load()
+	return opened
+
+def encode_image_data_url(image, max_side=1568, max_bytes=1024 * 1024):
+	"""Downscale and compress an image for a vision model. Returns (data_url, size_in_bytes)."""
+	if image.mode == "P":
+		image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+	has_alpha = image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema()[0] < 255
+	image = image.convert("RGBA" if has_alpha else "RGB")
+
+	# Vision models downscale internally anyway, larger images only cost upload time
+	if max(image.size) > max_side:
+		image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+	# Screenshots (flat UI colors, text) are smallest and sharp as lossless WebP, photos compress better as JPEG
+	sample = image.convert("RGB").resize((128, 128), Image.NEAREST)
+	flat = sample.getcolors(1024) is not None
+	fmt = "WEBP" if (flat or has_alpha) and WEBP_SUPPORTED else "JPEG"
+	if fmt == "JPEG" and has_alpha:
+		background = Image.new("RGB", image.size, (255, 255, 255))
+		background.paste(image, mask=image.getchannel("A"))
+		image = background
+
+	data = None
+	if fmt == "WEBP":
+		buffer = io.BytesIO()
+		image.save(buffer, format=fmt, lossless=True, method=4)
+		data = buffer.getvalue()
+
+	# JPEG, or WebP too large as lossless: lower the quality first, then downscale
+	while data is None or len(data) > max_bytes:
+		for quality in (90, 80, 70, 60, 50):
+			buffer = io.BytesIO()
+			if fmt == "JPEG":
+				image.save(buffer, format=fmt, quality=quality, optimize=True)
+			else:
+				image.save(buffer, format=fmt, quality=quality, method=4)
+			data = buffer.getvalue()
+			if len(data) <= max_bytes:
+				break
+		if len(data) <= max_bytes or max(image.size) <= 256:
+			break
+		image = image.resize((int(image.width * 0.75), int(image.height * 0.75)), Image.LANCZOS)
+
+	mime = "image/webp" if fmt == "WEBP" else "image/jpeg"
+	return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}", len(data)
 
 class ToastNotifier:
 	def __init__(self, theme, root=None):
@@ -141,20 +249,235 @@ class ToastNotifier:
 			toast_root.mainloop()
 
 		threading.Thread(target=show_toast, daemon=True).start()
-		
+
+def format_price(pricing):
+	if not pricing:
+		return ""
+	try:
+		prompt_price = float(pricing.get("prompt", 0)) * 1_000_000
+		completion_price = float(pricing.get("completion", 0)) * 1_000_000
+	except (TypeError, ValueError):
+		return ""
+	if prompt_price < 0 or completion_price < 0:
+		return "varies"
+	if prompt_price == 0 and completion_price == 0:
+		return "free"
+	return f"${prompt_price:.2f} / ${completion_price:.2f}"
+
+def format_context(length):
+	if not length:
+		return ""
+	return f"{length // 1000}K" if length >= 1000 else str(length)
+
+def is_subsequence(query, text):
+	it = iter(text)
+	return all(c in it for c in query)
+
+class ModelIndex:
+	"""Models from the cache, sorted and formatted once, searchable by prefix, substring and fuzzy match."""
+	def __init__(self, models_cache):
+		rows = []
+		for m in (models_cache or {}).get("data", []):
+			if "id" not in m:
+				continue
+			rows.append((m["id"], format_price(m.get("pricing", {})), format_context(m.get("context_length"))))
+		rows.sort()
+		self.rows = rows
+		self.keys = [(row[0].lower(), row[0].lower().split("/", 1)[-1]) for row in rows]
+		self.last_query = ""
+		self.last_candidates = list(range(len(rows)))
+
+	def search(self, query):
+		query = query.strip().lower()
+		if not query:
+			return self.rows
+
+		# A longer query can only narrow the previous matches, so typing doesn't rescan the whole catalog
+		if self.last_query and query.startswith(self.last_query):
+			pool = self.last_candidates
+		else:
+			pool = range(len(self.rows))
+
+		prefix, substring, fuzzy, candidates = [], [], [], []
+		for i in pool:
+			key, name = self.keys[i]
+			if key.startswith(query) or name.startswith(query):
+				prefix.append(self.rows[i])
+			elif query in key:
+				substring.append(self.rows[i])
+			elif is_subsequence(query, key):
+				fuzzy.append(self.rows[i])
+			else:
+				continue
+			candidates.append(i)
+
+		self.last_query = query
+		self.last_candidates = candidates
+		return prefix + substring + fuzzy
+
+class ChatSession:
+	"""Conversation of one shortcut: a rolling summary of older turns followed by the recent ones."""
+	def __init__(self):
+		self.summary = ""
+		self.turns = []
+		self.last_used = time.monotonic()
+
+	def messages(self):
+		# Only ever appended to between compactions, so providers can reuse the cached prefix
+		messages = []
+		if self.summary:
+			messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+		for prompt, answer in self.turns:
+			messages.append({"role": "user", "content": prompt})
+			messages.append({"role": "assistant", "content": answer})
+		return messages
+
+	def estimated_tokens(self):
+		# Roughly 4 characters per token
+		return (len(self.summary) + sum(len(p) + len(a) for p, a in self.turns)) // 4
+
+class ModelPicker(ttk.Frame):
+	"""Filterable model list with price and context columns. Only the visible rows exist as Treeview items."""
+	def __init__(self, parent, index, variable, rows=8, font=None):
+		super().__init__(parent)
+		self.index = index
+		self.variable = variable
+		self.rows = rows
+		self.matches = index.rows
+		self.offset = 0
+
+		self.query_var = tk.StringVar()
+		self.entry = tk.Entry(self, textvariable=self.query_var, font=font)
+		self.entry.pack(fill='x', pady=(0, 5))
+
+		body = ttk.Frame(self)
+		body.pack(fill='x')
+		self.tree = ttk.Treeview(body, columns=("model", "price", "context"), show="headings", height=rows, selectmode="browse")
+		self.tree.heading("model", text="Model", anchor='w')
+		self.tree.heading("price", text="In / Out per 1M", anchor='e')
+		self.tree.heading("context", text="Context", anchor='e')
+		self.tree.column("model", width=300, anchor='w')
+		self.tree.column("price", width=130, anchor='e', stretch=False)
+		self.tree.column("context", width=70, anchor='e', stretch=False)
+		self.scrollbar = ttk.Scrollbar(body, orient='vertical', command=self.yview)
+		self.tree.pack(side='left', fill='x', expand=True)
+		self.scrollbar.pack(side='right', fill='y')
+		self.items = [self.tree.insert("", "end", values=("", "", "")) for _ in range(rows)]
+
+		self.query_var.trace_add("write", lambda *_: self.apply_filter())
+		self.tree.bind("<<TreeviewSelect>>", self.on_select)
+		self.tree.bind("<MouseWheel>", self.on_wheel)
+		self.entry.bind("<Down>", lambda e: self.move_selection(1))
+		self.entry.bind("<Up>", lambda e: self.move_selection(-1))
+		self.entry.bind("<Next>", lambda e: self.move_selection(self.rows))
+		self.entry.bind("<Prior>", lambda e: self.move_selection(-self.rows))
+
+		self.scroll_to_selected()
+		self.render()
+
+	def set_index(self, index):
+		self.index = index
+		self.apply_filter()
+
+	def apply_filter(self):
+		self.matches = self.index.search(self.query_var.get())
+		self.offset = 0
+		self.render()
+
+	def selected_position(self):
+		selected = self.variable.get()
+		for i, row in enumerate(self.matches):
+			if row[0] == selected:
+				return i
+		return None
+
+	def scroll_to_selected(self):
+		position = self.selected_position()
+		if position is not None and not self.offset <= position < self.offset + self.rows:
+			self.offset = position - self.rows // 2
+
+	def render(self):
+		total = len(self.matches)
+		self.offset = max(0, min(self.offset, total - self.rows))
+		selected = self.variable.get()
+		selected_item = None
+		for i, item_id in enumerate(self.items):
+			position = self.offset + i
+			if position < total:
+				row = self.matches[position]
+				self.tree.item(item_id, values=row)
+				if row[0] == selected:
+					selected_item = item_id
+			else:
+				self.tree.item(item_id, values=("", "", ""))
+
+		if selected_item:
+			self.tree.selection_set(selected_item)
+		elif self.tree.selection():
+			self.tree.selection_remove(self.tree.selection())
+
+		if total:
+			self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.rows) / total))
+		else:
+			self.scrollbar.set(0.0, 1.0)
+
+	def yview(self, *args):
+		if args[0] == "moveto":
+			self.offset = int(float(args[1]) * len(self.matches))
+		elif args[0] == "scroll":
+			self.offset += int(args[1]) * (self.rows if args[2] == "pages" else 1)
+		self.render()
+
+	def on_wheel(self, event):
+		self.yview("scroll", -int(event.delta / 120) * 3, "units")
+		return "break"
+
+	def on_select(self, _event):
+		selection = self.tree.selection()
+		if not selection:
+			return
+		model_id = self.tree.item(selection[0], "values")[0]
+		if model_id and model_id != self.variable.get():
+			self.variable.set(model_id)
+
+	def move_selection(self, step):
+		if not self.matches:
+			return "break"
+		position = self.selected_position()
+		position = 0 if position is None else max(0, min(position + step, len(self.matches) - 1))
+		self.variable.set(self.matches[position][0])
+		if position < self.offset:
+			self.offset = position
+		elif position >= self.offset + self.rows:
+			self.offset = position - self.rows + 1
+		self.render()
+		return "break"
+
 class AIClipboardApp:
 	def __init__(self, root, theme):
 		self.root = root
 		self.config = load_config()
 		self.last_clipboard = ''
+		self.last_clipboard_seq = None
+		self.pending_image = None
 		self.tray_icon = None
 		self.models_cache = {}
 		self.processing = False
+		self.spool = load_spool()
+		self.spool_lock = threading.Lock()
+		self.delivery_lock = threading.Lock()
+		self.balance_lock = threading.Lock()
+		self.replaying = False
+		self.spool_online = False
+		self.sessions = {}
+		self.sessions_lock = threading.Lock()
 		self.load_models_cache()
+		self.model_index = ModelIndex(self.models_cache)
 		self.setup_ui()
 		self.root.withdraw()
 		self.setup_tray()
 		self.start_clipboard_monitor()
+		self.start_spool_monitor()
 		self.theme = theme
 
 	def setup_ui(self):
@@ -204,13 +527,12 @@ class AIClipboardApp:
 
 			entry.pack(fill='x', pady=(0, 5))
 
-		# Default model dropdown
+		# Default model picker
 		ttk.Label(frame, text="Default Model", font=font).pack(anchor='w', pady=(5, 5))
 		self.default_model_var = tk.StringVar(value=self.config.get("default_model"))
-		self.default_model_dropdown = ttk.Combobox(frame, textvariable=self.default_model_var,
-		                                           values=self.get_model_list(), width=60, state="readonly", font=font_bold)
-		self.default_model_dropdown.pack(fill='x')
-		root.option_add('*TCombobox*Listbox.font', font)
+		ttk.Label(frame, textvariable=self.default_model_var, font=font_bold).pack(anchor='w', pady=(0, 5))
+		self.default_model_picker = ModelPicker(frame, self.model_index, self.default_model_var, rows=5, font=font)
+		self.default_model_picker.pack(fill='x')
 
 
 		# Custom system prompt
@@ -310,6 +632,12 @@ Usage examples:
 
 {prefix}@knowledge:model:prompt
 - Send "prompt" to model using shortcut name "model", including context file "knowledge.md"
+
+{prefix}+:prompt
+{prefix}+:model:prompt
+- Follow up on the last answer of the default model or shortcut "model", keeping the conversation history. Every prompt without "+" starts a new conversation (cleared from the tray menu or after idle time)
+
+Copy an image (e.g. a screenshot) together with or right before a prompt to send it to a vision model.
 """
 		messagebox.showinfo("Help", help)
 		
@@ -337,8 +665,8 @@ Usage examples:
 
 		tk.Label(popup, text="Select Model", font=font).pack(anchor='w', pady=(0, 5))
 		model_var = tk.StringVar()
-		model_box = ttk.Combobox(popup, textvariable=model_var, values=self.get_model_list(), width=60, state="readonly")
-		model_box.pack(pady=(0, 5))
+		tk.Label(popup, textvariable=model_var, font=font_bold).pack(anchor='w', pady=(0, 5))
+		ModelPicker(popup, self.model_index, model_var, font=font).pack(fill='x', pady=(0, 5))
 
 		def confirm():
 			key = key_var.get().strip()
@@ -388,8 +716,10 @@ Usage examples:
 		tk.Label(popup, text="Select New Model", font=font).pack(anchor='w', pady=(0, 5))
 
 		model_var = tk.StringVar(value=current_model)
-		model_box = ttk.Combobox(popup, textvariable=model_var, values=self.get_model_list(), width=60, state="readonly", font=font)
-		model_box.pack(anchor='w', pady=(0, 5))
+		tk.Label(popup, textvariable=model_var, font=font_bold).pack(anchor='w', pady=(0, 5))
+		model_picker = ModelPicker(popup, self.model_index, model_var, font=font)
+		model_picker.pack(fill='x', pady=(0, 5))
+		model_picker.entry.focus_set()
 
 		def confirm():
 			new_model = model_var.get().strip()
@@ -421,11 +751,6 @@ Usage examples:
 			del self.config["model_shortcuts"][key]
 			self.refresh_shortcut_list()
 
-	def get_model_list(self):
-		if not self.models_cache:
-			return []
-		return sorted([m['id'] for m in self.models_cache.get('data', []) if 'id' in m])
-
 	def reset_balance(self):
 		if messagebox.askyesno("Reset Balance", "Are you sure you want to reset balance counter?"):
 			self.config["balance_usd"] = 0.0
@@ -502,6 +827,7 @@ Usage examples:
 		image = Image.open(icon_path) if icon_path else Image.new("RGB", (64, 64), color=(0, 0, 0))
 		menu = (
 			item("Configuration", lambda: self.root.after(0, self.show_main_window)),
+			item("Clear Sessions", lambda: self.root.after(0, self.clear_sessions)),
 			Menu.SEPARATOR,
 			item("Exit", lambda: self.root.after(0, self.exit_app))
 		)
@@ -522,6 +848,7 @@ Usage examples:
 			self.root.after(self.config.get("clipboard_refresh_interval", 500), self.check_clipboard)
 			return
 		try:
+			self.poll_clipboard_image()
 			text = pyperclip.paste().lstrip()
 			if text == self.last_clipboard:
 				self.root.after(self.config.get("clipboard_refresh_interval", 500), self.check_clipboard)
@@ -530,14 +857,12 @@ Usage examples:
 			self.last_clipboard = text
 			detected = self.parse_clipboard(text)
 			if detected:
-				model, prompt, context_key = detected
-				
+				model, prompt, context_key, session_key, continue_session = detected
 				context_text = ""
 				
 				if context_key:
 					try:
-						with open(os.path.join("knowledge", f"{context_key}.md"), "r", encoding="utf-8") as f:
-							context_text = "\n\n" + f.read().strip()
+						context_text = load_knowledge(context_key)
 					except FileNotFoundError:
 						logging.warning(f"Knowledge file not found: {context_key}.md")
 						self.notify(f"⚠️ Knowledge file not found: {context_key}.md", self.theme)
@@ -545,18 +870,68 @@ Usage examples:
 						self.root.after(self.config.get("clipboard_refresh_interval", 500), self.check_clipboard)
 						return
 
+				# Taken only once the prompt is going out, a recent but unrelated image must not block text-only models
+				image = self.take_pending_image()
+				if image is not None and self.supports_images(model) is False:
+					logging.warning(f"Model does not accept images, image dropped: {model}")
+					self.notify(f"⚠️ Model {model} does not accept images, the image was ignored.", self.theme)
+					image = None
+
 				msg = f"🌐 Processing with model: {model}"
 				if context_key:
 					msg += f" \n📄 Knowledge file: {context_key}.md"
+				if isinstance(image, str):
+					msg += f" \n🖼️ Image: {os.path.basename(image)}"
+				elif image is not None:
+					msg += f" \n🖼️ Image: {image.width}x{image.height}"
+				if continue_session:
+					msg += " \n💬 Continuing conversation"
 
 				self.notify(msg, theme)
 				winsound.PlaySound(os.path.join("sounds", "info.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
-				threading.Thread(target=self.process_prompt, args=(model, prompt, context_text), daemon=True).start()
+				threading.Thread(target=self.process_prompt, args=(model, prompt, context_text, image, context_key, session_key, continue_session), daemon=True).start()
 				
 		except Exception as e:
 			logging.error(f"Clipboard check failed: {e}")
 		self.root.after(self.config.get("clipboard_refresh_interval", 500), self.check_clipboard)
 
+	def poll_clipboard_image(self):
+		seq = clipboard_sequence_number()
+		if seq == self.last_clipboard_seq:
+			return
+		self.last_clipboard_seq = seq
+		try:
+			image = grab_clipboard_image()
+		except Exception as e:
+			logging.warning(f"Clipboard image read failed: {e}")
+			return
+		if image is not None:
+			self.pending_image = (image, time.monotonic())
+
+	def take_pending_image(self):
+		# An image is attached to the first prompt copied together with it or shortly after it
+		if not self.pending_image:
+			return None
+		image, stamp = self.pending_image
+		self.pending_image = None
+		if time.monotonic() - stamp > self.config.get("image_prompt_timeout", 60):
+			return None
+		return image
+
+	def get_model_info(self, model_id):
+		for m in self.models_cache.get("data", []):
+			if m.get("id") == model_id:
+				return m
+		return None
+
+	def supports_images(self, model_id):
+		# None means unknown (no cache entry), the request is sent anyway
+		model_info = self.get_model_info(model_id)
+		if not model_info:
+			return None
+		architecture = model_info.get("architecture", {})
+		modalities = architecture.get("input_modalities") or architecture.get("modality", "").split("->")[0].split("+")
+		return "image" in modalities
 	
 	def parse_clipboard(self, text):
 		# Validate prefix
@@ -569,11 +944,14 @@ Usage examples:
 
 		shortcut = None
 		context_key = None
+		continue_session = False
 		prompt_parts = []
 
-		# Parse parts: 1 shortcut, 1 context (@), then rest as prompt
+		# Parse parts: 1 session modifier (+), 1 shortcut, 1 context (@), then rest as prompt
 		for part in parts:
-			if part.startswith("@") and context_key is None:
+			if part == "+" and not continue_session:
+				continue_session = True
+			elif part.startswith("@") and context_key is None:
 				context_key = part[1:].lower()
 			elif shortcut is None and not part.startswith("@") and part in self.config.get("model_shortcuts", {}):
 				shortcut = part.lower()
@@ -588,28 +966,40 @@ Usage examples:
 		if shortcut:
 			model = self.config.get("model_shortcuts", {}).get(shortcut, model)
 
-		return model, prompt, context_key
+		# Sessions are kept per shortcut, "" is the default model's session
+		return model, prompt, context_key, shortcut or "", continue_session
 
 
 	def notify(self, message, theme):
 		self.toast = ToastNotifier(theme=theme, root=self.root)
 		self.toast.notify("AI Clipboard", message)
 
-	def process_prompt(self, model, prompt, context_text):
-		self.processing = True
-
-		try:
-			headers = {
-				"Authorization": f"Bearer {self.config.get('api_key')}",
-				"Content-Type": "application/json",
-				"HTTP-Referer": "https://github.com/",
-				"X-Title": "AI Clipboard"
-			}
-
-			if self.config.get("use_custom_prompt") and self.config.get("custom_system_instruction", "").strip():
-				system_instruction = f"{self.config['custom_system_instruction'].strip()}\n\nIMPORTANT: Use text below as your context:\n{context_text}"
-			else:
-				system_instruction = f"""You are a direct response AI assistant. Follow these rules strictly:
+	def post_chat(self, model, messages, timeout=30):
+		headers = {
+			"Authorization": f"Bearer {self.config.get('api_key')}",
+			"Content-Type": "application/json",
+			"HTTP-Referer": "https://github.com/",
+			"X-Title": "AI Clipboard"
+		}
+
+		data = {
+			"model": model,
+			"messages": messages,
+			"temperature": 0.7
+		}
+
+		url = self.config.get("base_url").rstrip("/") + "/chat/completions"
+		response = requests.post(url, headers=headers, json=data, timeout=timeout)
+		response.raise_for_status()
+		result = response.json()["choices"][0]["message"]["content"].strip()
+		self.update_balance(response)
+		return result
+
+	def request_completion(self, model, prompt, context_text, image=None, session=None):
+		if self.config.get("use_custom_prompt") and self.config.get("custom_system_instruction", "").strip():
+			system_instruction = f"{self.config['custom_system_instruction'].strip()}\n\nIMPORTANT: Use text below as your context:\n{context_text}"
+		else:
+			system_instruction = f"""You are a direct response AI assistant. Follow these rules strictly:
 1. Provide ONLY the direct answer/solution - no introductions, disclaimers, or conclusions
 2. For code requests, provide ONLY the code with minimal necessary comments
 3. Never ask questions back
@@ -621,30 +1011,111 @@ IMPORTANT: Use text below as your context:
 {context_text}
 """
 
-			data = {
-				"model": model,
-				"messages": [
-					{"role": "system", "content": system_instruction},
-					{"role": "user", "content": prompt}
-				],
-				"temperature": 0.7
-			}
-
-			url = self.config.get("base_url").rstrip("/") + "/chat/completions"
-			response = requests.post(url, headers=headers, json=data, timeout=30)
-			response.raise_for_status()
-			result = response.json()["choices"][0]["message"]["content"].strip()
+		user_content = prompt
+		if image is not None:
+			# Decoding and encoding run here, on the worker thread, so large images don't block Tk
+			image = open_image(image)
+			data_url, size = encode_image_data_url(
+				image,
+				max_side=self.config.get("image_max_side", 1568),
+				max_bytes=self.config.get("image_max_kb", 1024) * 1024
+			)
+			logging.info(f"Image {image.width}x{image.height} encoded to {size / 1024:.1f} KB")
+			user_content = [
+				{"type": "text", "text": prompt},
+				{"type": "image_url", "image_url": {"url": data_url}}
+			]
+
+		history = []
+		if session is not None:
+			history = session.messages()
+
+		messages = [{"role": "system", "content": system_instruction}, *history, {"role": "user", "content": user_content}]
+		result = self.post_chat(model, messages, timeout=60 if image is not None else 30)
+
+		# Remove wrapping backticks or triple-backtick code blocks
+		if result.startswith("```") and result.endswith("```"):
+			result = result.split("\n", 1)[-1].rsplit("\n", 1)[0].strip()
+		elif result.startswith("`") and result.endswith("`"):
+			result = result[1:-1].strip()
+
+		if session is not None:
+			session.turns.append((prompt, result))
+			session.last_used = time.monotonic()
+		return result
+
+	def get_session(self, key):
+		idle = self.config.get("session_idle_minutes", 30) * 60
+		now = time.monotonic()
+		with self.sessions_lock:
+			for expired in [k for k, session in self.sessions.items() if now - session.last_used > idle]:
+				del self.sessions[expired]
+			return self.sessions.setdefault(key, ChatSession())
+
+	def store_session(self, key, session):
+		with self.sessions_lock:
+			self.sessions[key] = session
+
+	def clear_sessions(self):
+		with self.sessions_lock:
+			self.sessions.clear()
+		self.notify("🧹 Sessions cleared.", self.theme)
+
+	def compact_session(self, session, model):
+		# Only the history is budgeted, the prompt and knowledge context are sent anyway and don't shrink by summarizing
+		budget = self.config.get("session_token_budget", 4000)
+		tokens = session.estimated_tokens()
+		if tokens <= budget or len(session.turns) <= 1:
+			return
 
-			# Remove wrapping backticks or triple-backtick code blocks
-			if result.startswith("```") and result.endswith("```"):
-				result = result.split("\n", 1)[-1].rsplit("\n", 1)[0].strip()
-			elif result.startswith("`") and result.endswith("`"):
-				result = result[1:-1].strip()			
-			
+		# One summary request per prompt. At least the older half is folded in, so the cached history prefix
+		# changes rarely, and more if needed to fit the budget. The newest turn is always kept.
+		count = 0
+		for p, a in session.turns[:-1]:
+			if count >= len(session.turns) // 2 and tokens <= budget:
+				break
+			tokens -= (len(p) + len(a)) // 4
+			count += 1
+
+		transcript = "\n\n".join(f"User: {p}\nAssistant: {a}" for p, a in session.turns[:count])
+		if session.summary:
+			transcript = f"Earlier summary:\n{session.summary}\n\n{transcript}"
+
+		session.summary = self.post_chat(model, [
+			{"role": "system", "content": "Summarize the conversation below in a few short paragraphs. Keep facts, decisions, names and numbers needed to continue it. Reply with the summary only."},
+			{"role": "user", "content": transcript}
+		])
+		session.turns = session.turns[count:]
+
+		tokens = session.estimated_tokens()
+		if tokens > budget:
+			logging.warning(f"Session compacted: {count} turn(s) summarized, history still ~{tokens} tokens over budget {budget}")
+		else:
+			logging.info(f"Session compacted: {count} turn(s) summarized, history ~{tokens} tokens")
+
+	def process_prompt(self, model, prompt, context_text, image=None, context_key=None, session_key="", continue_session=False):
+		self.processing = True
+
+		try:
+			# A plain prompt starts a new conversation for its shortcut (kept only if it succeeds), "+" continues it
+			session = self.get_session(session_key) if continue_session else ChatSession()
+			if continue_session:
+				self.compact_session(session, model)
+			result = self.request_completion(model, prompt, context_text, image, session)
+			if not continue_session:
+				self.store_session(session_key, session)
 			pyperclip.copy(result)
-			self.update_balance(response)
 			self.notify(f"✅ Response copied to clipboard.", self.theme)
 			winsound.PlaySound(os.path.join("sounds", "done.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+		except requests.ConnectionError as e:
+			# Images and session history aren't persisted, so only stateless text prompts can wait for the connection
+			logging.warning(f"Network unavailable: {e}")
+			if image is None and not continue_session and self.spool_prompt(model, prompt, context_key):
+				self.notify("📥 Offline: prompt queued, it will be sent when the connection is back.", self.theme)
+				winsound.PlaySound(os.path.join("sounds", "info.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+			else:
+				self.notify("❌ AI request failed.", self.theme)
+				winsound.PlaySound(os.path.join("sounds", "error.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
 		except Exception as e:
 			logging.error(f"Failed to process prompt: {e}")
 			self.notify("❌ AI request failed.", self.theme)
@@ -652,6 +1123,118 @@ IMPORTANT: Use text below as your context:
 		finally:
 			self.processing = False
 
+	def spool_prompt(self, model, prompt, context_key):
+		if self.config.get("spool_max_items", 20) <= 0:
+			return False
+		with self.spool_lock:
+			self.spool.append({
+				"created": time.time(),
+				"model": model,
+				"prompt": prompt,
+				"context_key": context_key
+			})
+			self.prune_spool()
+			save_spool(self.spool)
+		self.spool_online = False
+		return True
+
+	def prune_spool(self):
+		# Caller holds spool_lock
+		max_age = self.config.get("spool_max_age_hours", 24) * 3600
+		max_items = max(0, self.config.get("spool_max_items", 20))
+		now = time.time()
+		fresh = [entry for entry in self.spool if now - entry.get("created", 0) <= max_age]
+		dropped = len(self.spool) - len(fresh)
+		if len(fresh) > max_items:
+			dropped += len(fresh) - max_items
+			fresh = fresh[len(fresh) - max_items:]
+		if dropped:
+			logging.warning(f"Dropped {dropped} spooled prompt(s) over size or age limit")
+		self.spool = fresh
+
+	def remove_from_spool(self, entry):
+		with self.spool_lock:
+			if entry in self.spool:
+				self.spool.remove(entry)
+				save_spool(self.spool)
+
+	def is_online(self):
+		# Any HTTP response means the API host is reachable, the status code doesn't matter
+		try:
+			requests.head(self.config.get("base_url"), timeout=3)
+			return True
+		except requests.RequestException:
+			return False
+
+	def start_spool_monitor(self):
+		self.root.after(self.config.get("spool_probe_interval", 15) * 1000, self.check_spool)
+
+	def check_spool(self):
+		if self.spool and not self.replaying:
+			self.replaying = True
+			threading.Thread(target=self.replay_spool, daemon=True).start()
+		self.root.after(self.config.get("spool_probe_interval", 15) * 1000, self.check_spool)
+
+	def replay_spool(self):
+		try:
+			with self.spool_lock:
+				self.prune_spool()
+				save_spool(self.spool)
+				now = time.time()
+				entries = [entry for entry in self.spool if entry.get("next_attempt", 0) <= now]
+			if not entries:
+				return
+			if not self.is_online():
+				self.spool_online = False
+				return
+
+			logging.info(f"Replaying {len(entries)} spooled prompt(s)")
+			# Announced once per outage, not on every retry round
+			if not self.spool_online:
+				self.spool_online = True
+				self.notify(f"🔄 Connection restored, sending {len(entries)} queued prompt(s).", self.theme)
+			with ThreadPoolExecutor(max_workers=max(1, self.config.get("spool_replay_concurrency", 2))) as pool:
+				list(pool.map(self.replay_entry, entries))
+		finally:
+			self.replaying = False
+
+	def replay_entry(self, entry):
+		summary = textwrap.shorten(entry["prompt"], width=60, placeholder="…")
+		try:
+			context_text = load_knowledge(entry["context_key"]) if entry.get("context_key") else ""
+			result = self.request_completion(entry["model"], entry["prompt"], context_text)
+		except requests.ConnectionError as e:
+			# The probe can succeed while requests still fail (resets, proxy errors), so retries back off and are limited
+			max_attempts = self.config.get("spool_max_attempts", 5)
+			with self.spool_lock:
+				entry["attempts"] = entry.get("attempts", 0) + 1
+				attempts = entry["attempts"]
+				entry["next_attempt"] = time.time() + self.config.get("spool_probe_interval", 15) * 2 ** attempts
+				save_spool(self.spool)
+			if attempts < max_attempts:
+				logging.warning(f"Spooled prompt kept after {attempts} failed attempt(s): {e}")
+				return
+			logging.error(f"Spooled prompt dropped after {attempts} failed attempts: {e}")
+			self.remove_from_spool(entry)
+			self.notify(f"❌ Queued prompt failed:\n“{summary}”", self.theme)
+			winsound.PlaySound(os.path.join("sounds", "error.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+			return
+		except Exception as e:
+			logging.error(f"Spooled prompt failed: {e}")
+			self.remove_from_spool(entry)
+			self.notify(f"❌ Queued prompt failed:\n“{summary}”", self.theme)
+			winsound.PlaySound(os.path.join("sounds", "error.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+			return
+
+		self.remove_from_spool(entry)
+		# Several replies can arrive at once, the clipboard only keeps the last one so all are kept in the history file
+		with self.delivery_lock:
+			with open(os.path.join("logs", RESPONSES_PATH), 'a', encoding='utf-8') as f:
+				f.write(f"## {time.strftime('%Y-%m-%d %H:%M:%S')} – {entry['model']}\n\n> {entry['prompt']}\n\n{result}\n\n")
+			pyperclip.copy(result)
+		self.notify(f"✅ Queued response copied to clipboard:\n“{summary}”", self.theme)
+		winsound.PlaySound(os.path.join("sounds", "done.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+
 	def update_balance(self, response):
 		try:
 			usage = response.json().get("usage", {})
@@ -659,11 +1242,7 @@ IMPORTANT: Use text below as your context:
 			completion_tokens = usage.get("completion_tokens", 0)
 			model_id = response.json().get("model", "")
 
-			model_info = None
-			for m in self.models_cache.get("data", []):
-				if m.get("id") == model_id:
-					model_info = m
-					break
+			model_info = self.get_model_info(model_id)
 
 			if model_info:
 				pricing = model_info.get("pricing", {})
@@ -675,9 +1254,11 @@ IMPORTANT: Use text below as your context:
 				total_tokens = usage.get("total_tokens", 0)
 				total_cost = total_tokens / 1000.0 * 0.001
 
-			self.config["balance_usd"] = round(self.config.get("balance_usd", 0.0) + total_cost, 4)
-			self.balance_var.set(f"$ {self.config['balance_usd']:.4f}")
-			save_config(self.config)
+			# Replayed prompts finish on several threads at once, the increment must not interleave
+			with self.balance_lock:
+				self.config["balance_usd"] = round(self.config.get("balance_usd", 0.0) + total_cost, 4)
+				self.balance_var.set(f"$ {self.config['balance_usd']:.4f}")
+				save_config(self.config)
 		except Exception as e:
 			logging.warning(f"Balance update failed: {e}")
 
@@ -698,7 +1279,8 @@ IMPORTANT: Use text below as your context:
 			self.models_cache = response.json()
 			with open(os.path.join("cache", CACHE_PATH), 'w', encoding='utf-8') as f:
 				json.dump(self.models_cache, f, indent=2)
-			self.default_model_dropdown['values'] = self.get_model_list()
+			self.model_index = ModelIndex(self.models_cache)
+			self.default_model_picker.set_index(self.model_index)
 			self.model_cache_var.set(self.get_cache_info())
 			self.notify("✅ Models loaded and cached.", self.theme)
 			winsound.PlaySound(os.path.join("sounds", "done.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)